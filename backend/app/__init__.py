@@ -1,17 +1,47 @@
 # app/__init__.py
-from flask import Flask
-from flask_cors import CORS
+import os
+import logging
+from quart import Quart
+from quart_cors import cors
 from .routes import register_routes
 from .middleware import register_middleware
 from .middleware.error_handlers import register_error_handlers
+from .logging_setup import configure_logging
+from .services.search_service import SearchService
+from .services.bootstrap_service import BootstrapService
+from config import config
+
+logger = logging.getLogger(__name__)
 
 def create_app():
-    app = Flask(__name__)
-    CORS(app)
+    app_config = config[os.getenv('FLASK_ENV', 'default')]
+    configure_logging(app_config.LOG_FILE, app_config.LOG_LEVEL)
+    
+    app = Quart(__name__)
+    app = cors(app)
+    
+    # App-scoped services shared by all requests
+    app.extensions['bootstrap_service'] = BootstrapService()
     
     # Register components
     register_routes(app)
     register_middleware(app)
     register_error_handlers(app)
     
+    # Pay connection setup on the serving event loop before the first request
+    @app.before_serving
+    async def warmup_services():
+        try:
+            search_service = await SearchService.get_instance()
+            app.extensions['search_service'] = search_service
+            await search_service.warmup()
+        except Exception as e:
+            logger.warning("Service warmup failed: %s", e)
+    
+    @app.after_serving
+    async def close_services():
+        await app.extensions['bootstrap_service'].aclose()
+        if 'search_service' in app.extensions:
+            await app.extensions['search_service'].aclose()
+    
     return app
\ No newline at end of file
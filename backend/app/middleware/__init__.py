@@ -1,5 +1,5 @@
 import time
-from flask import request, g
+from quart import request, g
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,20 +7,20 @@ logger = logging.getLogger(__name__)
 def register_middleware(app):
     # Request Logger
     @app.before_request
-    def log_request():
+    async def log_request():
         g.start_time = time.time()
-        logger.info(f"Incoming {request.method} request to {request.path}")
+        logger.info("Incoming %s request to %s", request.method, request.path)
 
     # Response Logger
     @app.after_request
-    def log_response(response):
+    async def log_response(response):
         if hasattr(g, 'start_time'):
             elapsed = time.time() - g.start_time
-            logger.info(f"Request completed in {elapsed:.2f}s with status {response.status_code}")
+            logger.info("Request completed in %.2fs with status %s", elapsed, response.status_code)
         return response
 
     # Rate Limiting
     @app.before_request
-    def rate_limit():
+    async def rate_limit():
         # Implement rate limiting logic here
         pass
\ No newline at end of file
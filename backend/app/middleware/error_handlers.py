@@ -1,4 +1,4 @@
-from flask import jsonify
+from quart import jsonify
 
 def register_error_handlers(app):
     @app.errorhandler(400)
@@ -1,13 +1,12 @@
 # app/routes/bootstrap_routes.py
-from flask import Blueprint, jsonify, current_app
-from ..services.bootstrap_service import BootstrapService
+from quart import Blueprint, jsonify, current_app
 
 bootstrap_bp = Blueprint('bootstrap', __name__)
 
 @bootstrap_bp.route('/', methods=['POST'])
 async def initialize_system():
     try:
-        bootstrap_service = BootstrapService()
+        bootstrap_service = current_app.extensions['bootstrap_service']
         result = await bootstrap_service.bootstrap()
         return jsonify(result)
     except Exception as e:
@@ -16,7 +15,7 @@ async def initialize_system():
 @bootstrap_bp.route('/status', methods=['GET'])
 async def get_status():
     try:
-        bootstrap_service = BootstrapService()
+        bootstrap_service = current_app.extensions['bootstrap_service']
         status = await bootstrap_service.get_status()
         return jsonify(status)
     except Exception as e:
@@ -1,5 +1,5 @@
 # app/routes/search_routes.py
-from flask import Blueprint, jsonify, request
+from quart import Blueprint, jsonify, request
 from ..services.search_service import SearchService
 
 search_bp = Blueprint('search', __name__)
@@ -7,20 +7,22 @@ search_bp = Blueprint('search', __name__)
 @search_bp.route('/', methods=['POST'])
 async def search():
     try:
-        query = request.json.get('query')
+        query = (await request.get_json()).get('query')
         if not query:
             return jsonify({"error": "No query provided"}), 400
             
-        search_service = SearchService()
-        results = await search_service.search(query)
+        search_service = await SearchService.get_instance()
+        results = await search_service.search_with_timeout(query)
         return jsonify(results)
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @search_bp.route('/health', methods=['GET'])
 async def health_check():
     try:
-        search_service = SearchService()
+        search_service = await SearchService.get_instance()
         status = await search_service.health_check()
         return jsonify(status)
     except Exception as e:
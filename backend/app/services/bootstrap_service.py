@@ -1,21 +1,19 @@
 import os
+import httpx
 import openai
 import pinecone
 import logging
 import time
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Set, Tuple, AsyncIterable, AsyncIterator
 from tenacity import retry, stop_after_attempt, wait_exponential
-from .document_service import DocumentService
+from .document_service import DocumentService, chunk_id
+from .local_index import LocalIndex
+from .manifest import DocumentManifest
+from ..utils.tokenizer import deduplicate, encode_for_embedding
+from ..utils.exceptions import ResourceNotFound
 from config import config
 
-# setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bootstrap_service.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class BootstrapService:
@@ -23,156 +21,257 @@ class BootstrapService:
         self.config = config[os.getenv('FLASK_ENV', 'default')]
         self.doc_service = DocumentService()
         
-        # intitiaise openai
-        openai.api_key = self.config.OPENAI_API_KEY
+        # intitiaise openai with one pooled HTTP/2 client shared by all embedding batches
+        self.openai = openai.AsyncOpenAI(
+            api_key=self.config.OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.config.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=self.config.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+        )
         
         # Service configs
         self.batch_size = self.config.EMBEDDING_BATCH_SIZE  # Add to config: typically 100
-        self.max_workers = self.config.MAX_WORKERS         # Add to config: typically 5
+        self.max_workers = self.config.MAX_WORKERS         # Size of doc_service's extraction pool
+        self.embedding_concurrency = self.config.EMBEDDING_CONCURRENCY
         self.max_retries = 3
+        self.local_index = LocalIndex(self.config.LOCAL_INDEX_DIR) if self.config.USE_LOCAL_INDEX else None
+        self.manifest = DocumentManifest(self.config.MANIFEST_PATH)
+        self._index = None
+        
+    async def aclose(self):
+        """Release the pooled OpenAI connections and document workers"""
+        await self.openai.close()
+        self.doc_service.close()
         
-    async def check_embedding_status(self, chunk_id: str, index: Any) -> bool:
-        """Check if embedding already exists for a chunk"""
+    async def get_existing_chunk_ids(self, batch: List[Dict], index: Any) -> Set[str]:
+        """Return the ids of chunks in a batch that already have embeddings"""
         try:
-            result = index.fetch([chunk_id])
-            return bool(result.vectors)
+            result = await asyncio.to_thread(index.fetch, ids=[c["chunk_id"] for c in batch])
+            return set(result.vectors.keys())
         except Exception as e:
-            logger.error(f"Error checking embedding status: {str(e)}")
-            return False
+            logger.error("Error checking embedding status: %s", e)
+            return set()
         
     # @retry(stop_after_attempt(2), wait = wait_exponential(multiplier=1, min=2,max=4))
     async def create_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Create embeddings for a batch of texts with retry logic"""
         try:
-            response = await openai.embeddings.create(
-                model="text-embedding-ada-002",
-                input=texts
+            # Embed each distinct text once, truncated locally to the model's token limit
+            unique_texts, inverse = deduplicate(texts)
+            response = await self.openai.embeddings.create(
+                model=self.config.EMBEDDING_MODEL,
+                input=[
+                    encode_for_embedding(text, self.config.EMBEDDING_MODEL, self.config.EMBEDDING_MAX_TOKENS)
+                    for text in unique_texts
+                ]
             )
-            logger.info(f"Successfully created embeddings for batch of {len(texts)} texts")
-            return [data.embedding for data in response.data]
+            logger.info("Successfully created embeddings for batch of %s texts (%s unique)",
+                        len(texts), len(unique_texts))
+            embeddings = [data.embedding for data in response.data]
+            return [embeddings[i] for i in inverse]
         except Exception as e:
-            logger.error(f"Error creating embeddings batch: {str(e)}")
+            logger.error("Error creating embeddings batch: %s", e)
             raise
         
-    async def process_chunks_to_vectors(self, chunks: List[Dict], index: Any) -> List[Dict]:
-        """Convert chunks to vectors with embeddings"""
-        vectors = []
+    async def vectors_for_batch(self, batch_number: int, batch: List[Dict], index: Any) -> List[Dict]:
+        """Embed the chunks of a batch that are not in the index yet and build their vectors"""
+        # check which chunks need processing
+        existing = await self.get_existing_chunk_ids(batch, index)
+        if existing:
+            logger.info("%s chunks in batch %s already exist, skipping...", len(existing), batch_number)
         
-        for i in range(0, len(chunks), self.batch_size):
-            batch = chunks[i:i + self.batch_size]
-            new_chunks = []
-            new_chunks_texts = []
-            
-            # check which chunks need processing
-            
-            for chunk in batch:
-                if not await self.check_embedding_status(chunk["chunk_id"]):
-                    new_chunks.append(chunk)
-                    new_chunks_texts.append(chunk["context"])
-                else:
-                    logger.info(f"Chunk {chunk['chunk_id']} already exists, skipping...")
-                    
-            if not new_chunks:
-                continue
-            
+        new_chunks = [c for c in batch if c["chunk_id"] not in existing]
+        if not new_chunks:
+            return []
+        
+        # create embeddings only for new chunks
+        embeddings = await self.create_embeddings_batch([c["content"] for c in new_chunks])
+        
+        # create vectors with embeddings and metadata
+        processed_at = time.time()
+        return [
+            {
+                "id": chunk["chunk_id"],
+                "values": embedding,
+                "metadata": {
+                    **chunk["metadata"],
+                    "content": chunk["content"][:self.config.METADATA_CONTENT_LIMIT],
+                    "processed_at": processed_at
+                }
+            }
+            for chunk, embedding in zip(new_chunks, embeddings)
+        ]
+    
+    async def index_chunks(self, chunks: AsyncIterable[Dict], index: Any, stats: Dict[str, int],
+                           failed_documents: Set[str]):
+        """Embed and upsert a stream of chunks batch by batch as each batch fills
+
+        Filenames of documents with a chunk in a failed batch are added to failed_documents.
+        """
+        # A slot is held from when a batch is queued until it is upserted, so chunk intake
+        # stalls while embedding or upserting is the bottleneck and memory stays bounded
+        slots = asyncio.Semaphore(self.embedding_concurrency)
+        pending = set()
+        batches_submitted = 0
+        
+        async def index_batch(batch_number: int, batch: List[Dict]):
             try:
-                # create embeddings only for new chunks
-                if new_chunks_texts:
-                    embeddings = await self.create_embeddings_batch(new_chunks_texts)
-                    
-                    # create vectors with embeddings and metadata
-                    for chunk, embedding in zip(new_chunks, embeddings):
-                        vector = {
-                            "id": chunk["chunk_id"],
-                            "values": embedding,
-                            "metadata": {
-                                **chunk["metadata"],
-                                "content": chunk["content"],
-                                "processed_at": time.time()
-                            }
-                        }
-                    vectors.append(vector)
-                    
-                    logger.info(f"Processed batch {i//self.batch_size + 1}, "
-                              f"new vectors: {len(vectors)}")
-                    
+                vectors = await self.vectors_for_batch(batch_number, batch, index)
+                if not vectors:
+                    return
+                await self.upsert_batch(index, vectors)
+                
+                # Mirror the new vectors locally so search can skip the Pinecone round trip
+                if self.local_index is not None:
+                    await asyncio.to_thread(self.local_index.stage, vectors)
+                
+                stats["new_vectors_created"] += len(vectors)
+                stats["batches_processed"] += 1
+                logger.info("Processed batch %s, new vectors: %s", batch_number, len(vectors))
             except Exception as e:
-                logger.error(f"Error processing batch {i//self.batch_size + 1}: {str(e)}")
-                continue
+                logger.error("Error processing batch %s: %s", batch_number, e)
+                failed_documents.update(c["metadata"].get("filename") for c in batch)
+            finally:
+                slots.release()
+        
+        async def submit(batch: List[Dict]):
+            nonlocal batches_submitted
+            await slots.acquire()
+            batches_submitted += 1
+            task = asyncio.create_task(index_batch(batches_submitted, batch))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        
+        batch = []
+        try:
+            async for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) == self.batch_size:
+                    await submit(batch)
+                    batch = []
+            if batch:
+                await submit(batch)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
         
-        return vectors
+        await asyncio.gather(*pending)
     
     #@retry(stop=stop_after_attempt(2), wait=wait_exponential(multiplier=1, min=2, max=4))
-    async def upsert_vectors_batch(self, index: Any, vectors: List[Dict]) -> bool:
-        """Upsert a batch of vectors to Pinecone with retry logic"""
+    async def upsert_batch(self, index: Any, vectors: List[Dict]):
+        """Upsert one batch of vectors to Pinecone without blocking the event loop"""
         try:
-            # Check for empty vectors
-            if not vectors:
-                logger.info("No vectors to upsert. Skipping upsert process.")
-                return False
-            
-            # Proceed with upserting if vectors are not empty
-            index.upsert(vectors=vectors)
-            logger.info(f"Successfully upserted batch of {len(vectors)} vectors")
-            return True
+            # Send on the index's own thread pool and only wait for the reply in a worker thread
+            async_result = index.upsert(vectors=vectors, async_req=True)
+            await asyncio.to_thread(async_result.get)
         except Exception as e:
-            logger.error(f"Error upserting vectors batch: {str(e)}")
+            logger.error("Error upserting vectors batch: %s", e)
             raise
 
         
+    async def delete_vectors(self, index: Any, ids: List[str]):
+        """Delete vectors from Pinecone, and the local index when enabled"""
+        try:
+            for i in range(0, len(ids), self.batch_size):
+                await asyncio.to_thread(index.delete, ids=ids[i:i + self.batch_size])
+            if self.local_index is not None:
+                self.local_index.stage_delete(ids)
+            logger.info("Deleted %s stale vectors", len(ids))
+        except Exception as e:
+            logger.error("Error deleting stale vectors: %s", e)
+            raise
+        
+    async def seed_local_index(self, index: Any, entries: Dict[str, Tuple[str, int]]):
+        """Copy vectors of indexed documents that the local index lacks out of Pinecone"""
+        # Covers documents indexed before USE_LOCAL_INDEX was turned on, which bootstrap then skips
+        ids = [chunk_id(key, i) for key, chunk_count in entries.values() for i in range(chunk_count)]
+        missing = await asyncio.to_thread(self.local_index.missing_ids, ids)
+        for i in range(0, len(missing), self.batch_size):
+            result = await asyncio.to_thread(index.fetch, ids=missing[i:i + self.batch_size])
+            await asyncio.to_thread(self.local_index.stage, [
+                {"id": vector.id, "values": vector.values, "metadata": vector.metadata}
+                for vector in result.vectors.values()
+            ])
+        if missing:
+            logger.info("Seeded local index with %s vectors from Pinecone", len(missing))
+        
+    def _connect_index(self) -> Any:
+        """Resolve the Pinecone index handle; blocking, so only call it off the event loop"""
+        pinecone.init(
+            api_key=self.config.PINECONE_API_KEY,
+            environment=self.config.PINECONE_ENV
+        )
+        
+        if self.config.PINECONE_INDEX not in pinecone.list_indexes():
+            raise ResourceNotFound(f"Index {self.config.PINECONE_INDEX} not found")
+        
+        return pinecone.Index(
+            self.config.PINECONE_INDEX,
+            pool_threads=self.config.PINECONE_POOL_THREADS
+        )
+        
+    async def get_index(self) -> Any:
+        """Pinecone index handle, resolved once in a worker thread and reused across status polls"""
+        if self._index is None:
+            self._index = await asyncio.to_thread(self._connect_index)
+        return self._index
+        
     async def initialize_or_validate_index(self) -> Any:
         """Initialize Pinecone index or validate existing one"""
         try:
-            # Initialize Pinecone
-            pinecone.init(
-                api_key=self.config.PINECONE_API_KEY,
-                environment=self.config.PINECONE_ENV
-            )
-            
             # Check if index exists
-            if self.config.PINECONE_INDEX not in pinecone.list_indexes():
-                logger.info(f"Creating new index: {self.config.PINECONE_INDEX}")
-                pinecone.create_index(
+            try:
+                index = await self.get_index()
+            except ResourceNotFound:
+                logger.info("Creating new index: %s", self.config.PINECONE_INDEX)
+                await asyncio.to_thread(
+                    pinecone.create_index,
                     name=self.config.PINECONE_INDEX,
                     dimension=1536,
                     metric='cosine'
                 )
-                # Wait for index to be ready
-                time.sleep(7)
-            
-            index = pinecone.Index(self.config.PINECONE_INDEX)
+                # Wait for index to be ready without blocking the event loop
+                for delay in (0.5, 1, 2, 4, 8):
+                    await asyncio.sleep(delay)
+                    description = await asyncio.to_thread(pinecone.describe_index, self.config.PINECONE_INDEX)
+                    if description.status['ready']:
+                        break
+                else:
+                    logger.warning("Index %s is not ready yet, continuing", self.config.PINECONE_INDEX)
+                index = await self.get_index()
             
             # Validate index
-            stats = index.describe_index_stats()
-            logger.info(f"Index stats: {stats}")
+            stats = await asyncio.to_thread(index.describe_index_stats)
+            logger.info("Index stats: %s", stats)
             
             return index
             
         except Exception as e:
-            logger.error(f"Error initializing Pinecone index: {str(e)}")
+            logger.error("Error initializing Pinecone index: %s", e)
             raise
         
     async def get_status(self) -> Dict:
         """Get current status of vector database"""
         try:
-            pinecone.init(
-                api_key=self.config.PINECONE_API_KEY,
-                environment=self.config.PINECONE_ENV
-            )
-            
-            if self.config.PINECONE_INDEX in pinecone.list_indexes():
-                index = pinecone.Index(self.config.PINECONE_INDEX)
-                stats = index.describe_index_stats()
-                return {
-                    "status": "active",
-                    "vector_count": stats.total_vector_count,
-                    "index_fullness": stats.index_fullness
-                }
+            try:
+                index = await self.get_index()
+            except ResourceNotFound:
+                return {"status": "index_not_found"}
             
-            return {"status": "index_not_found"}
+            stats = await asyncio.to_thread(index.describe_index_stats)
+            return {
+                "status": "active",
+                "vector_count": stats.total_vector_count,
+                "index_fullness": stats.index_fullness
+            }
             
         except Exception as e:
-            logger.error(f"Error getting status: {str(e)}")
+            logger.error("Error getting status: %s", e)
             return {"status": "error", "message": str(e)}
     
         
@@ -180,6 +279,7 @@ class BootstrapService:
         """Main bootstrap process"""
         start_time = time.time()
         stats = {
+            "documents_processed": 0,
             "chunks_processed": 0,
             "new_vectors_created": 0,
             "batches_processed": 0
@@ -189,30 +289,50 @@ class BootstrapService:
             # Initialize index
             index = await self.initialize_or_validate_index()
             
-            # Get chunks from document service
-            logger.info("Starting document processing")
-            chunks = await self.doc_service.process_all()
-            stats["chunks_processed"] = len(chunks)
-            time.sleep(2)
-            
-            # Process chunks to vectors
-            logger.info("Converting chunks to vectors")
-            vectors = await self.process_chunks_to_vectors(chunks, index)
-            stats["new_vectors_created"] = len(vectors)
-            time.sleep(2)
-            
-            # Upsert vectors in batches
-            if vectors:
-                logger.info("Upserting vectors to Pinecone")
-                for i in range(0, len(vectors), self.batch_size):
-                    batch = vectors[i:i + self.batch_size]
-                    await self.upsert_vectors_batch(index, batch)
-                    stats["batches_processed"] += 1
-            else:
+            # Documents indexed at their current content and chunking by an earlier run are skipped
+            known = await asyncio.to_thread(self.manifest.get_entries)
+            document_keys = {}
+            chunk_counts = {}
+            failed_documents = set()
+            
+            # Stream chunks from document service straight into the embedding pipeline
+            async def counted_chunks() -> AsyncIterator[Dict]:
+                async for chunk in self.doc_service.iter_chunks({f: key for f, (key, _) in known.items()}):
+                    stats["chunks_processed"] += 1
+                    filename = chunk["metadata"].get("filename")
+                    document_keys[filename] = chunk["document_key"]
+                    chunk_counts[filename] = chunk_counts.get(filename, 0) + 1
+                    yield chunk
+            
+            # Embed and upsert each batch as it fills, so the corpus is never held in memory
+            logger.info("Processing documents and upserting chunk vectors")
+            await self.index_chunks(counted_chunks(), index, stats, failed_documents)
+            if not stats["new_vectors_created"]:
                 logger.info("No new vectors to upsert")
             
+            # Only record documents once all of their vectors are in the index
+            indexed = {
+                f: (key, chunk_counts[f]) for f, key in document_keys.items() if f not in failed_documents
+            }
+            
+            # Documents re-indexed under a new key leave their old chunks behind, so remove them
+            stale_ids = []
+            for filename, (key, _) in indexed.items():
+                old_key, old_count = known.get(filename, (key, 0))
+                if old_key != key:
+                    stale_ids.extend(chunk_id(old_key, i) for i in range(old_count))
+            if stale_ids:
+                await self.delete_vectors(index, stale_ids)
+            
+            if self.local_index is not None:
+                await self.seed_local_index(index, {**known, **indexed})
+                await asyncio.to_thread(self.local_index.commit)
+            
+            await asyncio.to_thread(self.manifest.record, indexed)
+            stats["documents_processed"] = len(indexed)
+            
             execution_time = time.time() - start_time
-            logger.info(f"Bootstrap completed in {execution_time:.2f} seconds")
+            logger.info("Bootstrap completed in %.2f seconds", execution_time)
             
             return {
                 "status": "success",
@@ -221,7 +341,7 @@ class BootstrapService:
             }
             
         except Exception as e:
-            logger.error(f"Bootstrap failed: {str(e)}")
+            logger.error("Bootstrap failed: %s", e)
             raise
 
                       
@@ -1,185 +1,291 @@
 import os
-import json 
+import orjson
 import uuid
+import gzip
+import hashlib
+import asyncio
 import logging
-from typing import Dict, List, Generator
-from PyPDF2 import PdfReader
+from typing import Dict, List, Tuple, Optional, AsyncIterator
+import pypdfium2 as pdfium
 from config import config
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('document_processing.log')
-    ]
-)
+from concurrent.futures import ProcessPoolExecutor
+
 logger = logging.getLogger(__name__)
 
+PDF_SUFFIXES = frozenset({'.pdf'})
+
+def is_pdf(filename: str) -> bool:
+    """Case-insensitive check for a PDF file extension"""
+    return os.path.splitext(filename)[1].lower() in PDF_SUFFIXES
+
+def extract_pdf_text(pdf_path: str) -> str:
+    """Extract text from a PDF with PDFium"""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return "".join(page.get_textpage().get_text_range() for page in pdf)
+    finally:
+        pdf.close()
+
+def file_digest(path: str) -> str:
+    """Hash a file's contents in fixed-size blocks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_pdf_text_cached(pdf_path: str, cache_dir: str, digest: Optional[str] = None) -> str:
+    """Extract text from a PDF, reusing a gzip cache keyed by the file's content hash"""
+    # newline="" keeps the \r\n PDFium emits, so cached text matches a fresh extraction exactly
+    cache_path = os.path.join(cache_dir, f"{digest or file_digest(pdf_path)}.txt.gz")
+    if os.path.exists(cache_path):
+        with gzip.open(cache_path, 'rt', encoding='utf-8', newline='') as f:
+            return f.read()
+
+    text = extract_pdf_text(pdf_path)
+
+    # Write to a temporary file first so concurrent readers never see a partial cache entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+    return text
+
+def document_key(digest: str, chunk_size: int, chunk_overlap: int) -> str:
+    """Identify a document's chunks by its content digest and the parameters it is chunked with"""
+    return f"{digest}:{chunk_size}:{chunk_overlap}"
+
+def chunk_id(key: str, chunk_index: int) -> str:
+    """Derive a stable chunk id, so unchanged documents re-chunk to the ids already upserted"""
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{key}:{chunk_index}"))
+
+def extract_document(pdf_path: str, doc_metadata: Dict, cache_dir: str, chunk_size: int, chunk_overlap: int,
+                     known_key: Optional[str] = None) -> Dict:
+    """Extract a single PDF into a document; module-level so it pickles into worker processes"""
+    digest = file_digest(pdf_path)
+    key = document_key(digest, chunk_size, chunk_overlap)
+    if key == known_key:
+        # Already indexed at this content and chunking, skip extraction entirely
+        return {'metadata': doc_metadata, 'key': key, 'unchanged': True}
+    return {
+        'content': extract_pdf_text_cached(pdf_path, cache_dir, digest),
+        'metadata': doc_metadata,
+        'key': key
+    }
+
+def compute_chunk_offsets(text_len: int, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Compute (start, end) offsets of overlapping chunks covering a text"""
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("chunk_overlap must be smaller than chunk_size")
+
+    offsets = []
+    for start in range(0, text_len, step):
+        end = min(start + chunk_size, text_len)
+        offsets.append((start, end))
+        if end == text_len:
+            break
+    return offsets
+
 class DocumentService:
     def __init__(self):
         self.config = config[os.getenv('FLASK_ENV','default')]
         self.pdf_dir = self.config.PDF_DIR
         self.metadata_path = self.config.METADATA_PATH
+        self.pdf_cache_dir = self.config.PDF_CACHE_DIR
         self.chunk_size = self.config.CHUNK_SIZE
         self.chunk_overlap = self.config.CHUNK_OVERLAP
-        self.max_workers = self.config.MAX_WORKERS  # Add to config: typically 5-10
+        self.max_workers = self.config.MAX_WORKERS  # Extraction processes for this server process
+        self.max_documents_in_flight = self.config.MAX_DOCUMENTS_IN_FLIGHT
         self.batch_size = self.config.BATCH_SIZE    # Add to config: typically 5
+        self._metadata_by_filename = {m['filename']: m for m in self.load_metadata()}
+        # Reused across runs; workers are spawned lazily on first use
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def close(self):
+        """Shut down the worker process pool"""
+        # Called from async shutdown hooks, so drop queued work rather than blocking the event loop
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
     def load_metadata(self) -> List[Dict]:
         try:
-            with open(self.metadata_path, 'r') as f:
-                metadata = json.load(f)
-            logger.info(f"Successfully loaded metadata for {len(metadata)} documents")
+            with open(self.metadata_path, 'rb') as f:
+                metadata = orjson.loads(f.read())['documents']
+            logger.info("Successfully loaded metadata for %s documents", len(metadata))
             return metadata
         except Exception as e:
-            logger.error(f"Failed to load metadata: {str(e)}")
+            logger.error("Failed to load metadata: %s", e)
             raise
 
     def load_pdf_content(self, pdf_path: str) -> str:
         try:
-            reader = PdfReader(pdf_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-            logger.info(f"Successfully extracted text from {pdf_path}")
+            text = extract_pdf_text_cached(pdf_path, self.pdf_cache_dir)
+            logger.info("Successfully extracted text from %s", pdf_path)
             return text
         except Exception as e:
-            logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
+            logger.error("Error reading PDF %s: %s", pdf_path, e)
             raise
 
-    def process_single_document(self, filename: str, metadata: List[Dict]) -> Dict:
+    def process_single_document(self, filename: str) -> Dict:
         """Process a single PDF document"""
         try:
-            if not filename.endswith('.pdf'):
+            if not is_pdf(filename):
                 return None
             
             pdf_path = os.path.join(self.pdf_dir, filename)
-            doc_metadata = next((m for m in metadata if m['filename'] == filename), None)
+            doc_metadata = self._metadata_by_filename.get(filename)
             
             if not doc_metadata:
-                logger.warning(f"No metadata found for {filename}")
+                logger.warning("No metadata found for %s", filename)
                 return None
 
             content = self.load_pdf_content(pdf_path)
-            logger.info(f"Successfully processed document: {filename}")
+            logger.info("Successfully processed document: %s", filename)
             return {'content': content, 'metadata': doc_metadata}
             
         except Exception as e:
-            logger.error(f"Error processing document {filename}: {str(e)}")
+            logger.error("Error processing document %s: %s", filename, e)
             return None
 
-    async def process_documents_parallel(self) -> List[Dict]:
-        """Process PDFs in parallel"""
+    async def iter_documents(self, known_keys: Optional[Dict[str, str]] = None) -> AsyncIterator[Dict]:
+        """Yield processed PDFs as soon as their worker process finishes
+
+        Documents whose document key matches known_keys[filename] are skipped.
+        """
+        known_keys = known_keys or {}
         try:
-            metadata = self.load_metadata()
-            filenames = [f for f in os.listdir(self.pdf_dir) if f.endswith('.pdf')]
-            documents = []
+            with os.scandir(self.pdf_dir) as entries:
+                filenames = [e.name for e in entries if e.is_file() and is_pdf(e.name)]
 
-            logger.info(f"Starting parallel processing of {len(filenames)} documents")
+            # Resolve metadata up front so only one small dict is sent to each worker
+            jobs = []
+            for filename in filenames:
+                doc_metadata = self._metadata_by_filename.get(filename)
+                if not doc_metadata:
+                    logger.warning("No metadata found for %s", filename)
+                    continue
+                jobs.append((filename, doc_metadata))
+
+            logger.info("Starting parallel processing of %s documents", len(jobs))
             
-            # Process documents in parallel
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Create partial function with metadata
-                process_doc = partial(self.process_single_document, metadata=metadata)
-                
-                # Process files in parallel
-                futures = list(executor.map(process_doc, filenames))
-                
-                # Filter out None results and extend documents
-                documents.extend([doc for doc in futures if doc is not None])
-
-            logger.info(f"Successfully processed {len(documents)} documents in parallel")
-            return documents
+            # Text extraction is CPU-bound, so use processes rather than threads
+            loop = asyncio.get_running_loop()
+
+            # A slot is held from submission until the consumer has taken the document,
+            # bounding how much extracted text is in memory at once
+            in_flight = asyncio.Semaphore(self.max_documents_in_flight)
+
+            async def extract(filename: str, doc_metadata: Dict) -> Optional[Dict]:
+                await in_flight.acquire()
+                handed_over = False
+                try:
+                    document = await loop.run_in_executor(
+                        self._pool, extract_document,
+                        os.path.join(self.pdf_dir, filename), doc_metadata, self.pdf_cache_dir,
+                        self.chunk_size, self.chunk_overlap, known_keys.get(filename)
+                    )
+                    # The consumer releases the slot of a document it is handed
+                    handed_over = not document.get('unchanged')
+                    return document
+                except Exception as e:
+                    logger.error("Error processing document %s: %s", filename, e)
+                    return None
+                finally:
+                    if not handed_over:
+                        in_flight.release()
+
+            tasks = [asyncio.create_task(extract(f, m)) for f, m in jobs]
+            processed = unchanged = 0
+            try:
+                for next_document in asyncio.as_completed(tasks):
+                    document = await next_document
+                    if document is None:
+                        continue
+                    if document.get('unchanged'):
+                        unchanged += 1
+                        continue
+                    processed += 1
+                    try:
+                        yield document
+                    finally:
+                        # Drop this frame's reference so the consumer alone decides when the text is freed
+                        document = None
+                        in_flight.release()
+            finally:
+                # Stop pending extractions if the consumer bailed out or we were cancelled
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            logger.info("Successfully processed %s documents in parallel, skipped %s unchanged", processed, unchanged)
 
         except Exception as e:
-            logger.error(f"Error in parallel document processing: {str(e)}")
+            logger.error("Error in parallel document processing: %s", e)
             raise
 
-    def create_chunks(self, text: str, metadata: Dict) -> List[Dict]:
+    def create_chunks(self, text: str, metadata: Dict, key: Optional[str] = None) -> List[Dict]:
         """Create chunks from text with metadata"""
         try:
-            chunks = []
-            start = 0
-            chunk_index = 0
-
-            while start < len(text):
-                end = start + self.chunk_size
-                if start > 0:
-                    start = start - self.chunk_overlap
-                
-                chunk_text = text[start:end]
-                
-                chunk = {
-                    "chunk_id": str(uuid.uuid4()),
-                    "content": chunk_text,
+            offsets = compute_chunk_offsets(len(text), self.chunk_size, self.chunk_overlap)
+            chunks = [
+                {
+                    "chunk_id": chunk_id(key, chunk_index) if key else str(uuid.uuid4()),
+                    "document_key": key,
+                    "content": text[start:end],
                     "metadata": {
                         **metadata,
-                        "chunk_index": chunk_index,
-                        "is_first_chunk": chunk_index == 0,
-                        "chunk_start": start,
-                        "chunk_end": end
+                        # Offsets are reconstructable as chunk_index * (chunk_size - chunk_overlap)
+                        "chunk_index": chunk_index
                     }
                 }
-                
-                chunks.append(chunk)
-                start = end
-                chunk_index += 1
+                for chunk_index, (start, end) in enumerate(offsets)
+            ]
 
-            logger.info(f"Created {len(chunks)} chunks for document: {metadata.get('filename')}")
+            logger.info("Created %s chunks for document: %s", len(chunks), metadata.get('filename'))
             return chunks
 
         except Exception as e:
-            logger.error(f"Error creating chunks for document {metadata.get('filename')}: {str(e)}")
+            logger.error("Error creating chunks for document %s: %s", metadata.get('filename'), e)
             raise
 
-    async def process_chunks_in_batches(self, documents: List[Dict]) -> Generator[Dict, None, None]:
-        """Process document chunks in batches"""
+    async def iter_chunks(self, known_keys: Optional[Dict[str, str]] = None) -> AsyncIterator[Dict]:
+        """Yield chunks document by document without holding the whole corpus in memory"""
         try:
-            total_chunks = []
+            total_chunks = 0
             
-            for i in range(0, len(documents), self.batch_size):
-                batch = documents[i:i + self.batch_size]
-                logger.info(f"Processing batch {i//self.batch_size + 1}")
-                
-                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                    # Process each document in the batch
-                    futures = [
-                        executor.submit(self.create_chunks, doc['content'], doc['metadata'])
-                        for doc in batch
-                    ]
-                    
-                    # Collect results
-                    for future in futures:
-                        try:
-                            chunks = future.result()
-                            total_chunks.extend(chunks)
-                        except Exception as e:
-                            logger.error(f"Error processing chunk batch: {str(e)}")
-
-            logger.info(f"Successfully processed all chunks. Total chunks: {len(total_chunks)}")
-            return total_chunks
+            async for document in self.iter_documents(known_keys):
+                try:
+                    chunks = await asyncio.to_thread(
+                        self.create_chunks, document['content'], document['metadata'], document['key']
+                    )
+                except Exception as e:
+                    logger.error("Error processing chunk batch: %s", e)
+                    continue
+                # Chunks hold their own slices; iter_documents drops its reference on resume,
+                # so the full text is freed before the next document is awaited
+                del document
+
+                total_chunks += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+
+            logger.info("Successfully processed all chunks. Total chunks: %s", total_chunks)
 
         except Exception as e:
-            logger.error(f"Error in batch chunk processing: {str(e)}")
+            logger.error("Error in batch chunk processing: %s", e)
             raise
 
     async def process_all(self) -> List[Dict]:
-        """Main method to process all documents and chunks"""
+        """Main method to process all documents and chunks into a list"""
         try:
             logger.info("Starting document processing pipeline")
             
-            # Process documents in parallel
-            documents = await self.process_documents_parallel()
-            
-            # Process chunks in batches
-            chunks = await self.process_chunks_in_batches(documents)
+            chunks = [chunk async for chunk in self.iter_chunks()]
             
             logger.info("Completed document processing pipeline")
             return chunks
 
         except Exception as e:
-            logger.error(f"Error in document processing pipeline: {str(e)}")
+            logger.error("Error in document processing pipeline: %s", e)
             raise
\ No newline at end of file
@@ -0,0 +1,164 @@
+import os
+import orjson
+import logging
+import threading
+from typing import List, Dict, Set, Tuple, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows dequantized at a time while scoring, bounding the float32 working set (~50MB at 1536 dims)
+QUERY_BLOCK_ROWS = 8192
+
+def quantize(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize float32 rows to int8 with one symmetric scale per row"""
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales = np.maximum(scales, np.finfo(np.float32).tiny).astype(np.float32)
+    quantized = np.clip(np.round(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales
+
+class LocalIndex:
+    """Memory-mapped int8 snapshot of the vectors bootstrap upserts, searched by exact dot product"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.embeddings_path = os.path.join(directory, 'embeddings.i8.npy')
+        self.scales_path = os.path.join(directory, 'scales.f32.npy')
+        self.records_path = os.path.join(directory, 'records.json')
+        self.embeddings: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.records: List[Dict] = []
+        self._loaded_mtime = None
+        # Searches refresh and bootstrap stages from worker threads, so loads, snapshot reads
+        # and staging bookkeeping are serialized; reentrant because staging may refresh
+        self._lock = threading.RLock()
+        # Vectors quantized by stage() and not yet written by commit()
+        self._staged: List[Tuple[np.ndarray, np.ndarray, List[Dict]]] = []
+        self._staged_ids: Optional[Set[str]] = None
+        self._deleted_ids: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def version(self) -> Optional[int]:
+        """mtime of the loaded snapshot, changing whenever a new one is loaded"""
+        return self._loaded_mtime
+
+    def refresh(self) -> bool:
+        """(Re)load the snapshot if it changed on disk; return whether one is available"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.embeddings_path).st_mtime_ns
+            except FileNotFoundError:
+                return False
+
+            if mtime != self._loaded_mtime:
+                embeddings = np.load(self.embeddings_path, mmap_mode='r')
+                scales = np.load(self.scales_path)
+                with open(self.records_path, 'rb') as f:
+                    records = orjson.loads(f.read())
+                if not len(records) == len(scales) == len(embeddings):
+                    logger.warning("Local index at %s is inconsistent, ignoring it", self.directory)
+                    return False
+                self.embeddings, self.scales, self.records = embeddings, scales, records
+                self._loaded_mtime = mtime
+                logger.info("Loaded local index with %s vectors", len(records))
+
+            return self.embeddings is not None and len(self.records) > 0
+
+    def _known_ids(self) -> Set[str]:
+        """Ids in the snapshot or staged since the last commit; call with the lock held"""
+        if self._staged_ids is None:
+            self.refresh()
+            self._staged_ids = {record["id"] for record in self.records}
+        return self._staged_ids
+
+    def missing_ids(self, ids: List[str]) -> List[str]:
+        """Return the ids that are neither in the snapshot nor staged"""
+        with self._lock:
+            known_ids = self._known_ids()
+            return [i for i in ids if i not in known_ids]
+
+    def stage(self, vectors: List[Dict]):
+        """Quantize Pinecone-style vectors ({id, values, metadata}) for the next commit"""
+        # Reserve the ids under the lock so concurrent batches never stage the same vector twice
+        with self._lock:
+            known_ids = self._known_ids()
+            vectors = [v for v in vectors if v["id"] not in known_ids]
+            known_ids.update(v["id"] for v in vectors)
+        if not vectors:
+            return
+
+        try:
+            # Only the int8 rows are kept, so staging a corpus costs ~1.5KB per 1536-dim vector
+            embeddings, scales = quantize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        except Exception:
+            with self._lock:
+                known_ids.difference_update(v["id"] for v in vectors)
+            raise
+        with self._lock:
+            self._staged.append((embeddings, scales, [{"id": v["id"], "metadata": v["metadata"]} for v in vectors]))
+
+    def stage_delete(self, ids: List[str]):
+        """Mark vectors for removal at the next commit"""
+        with self._lock:
+            self._deleted_ids.update(ids)
+
+    def commit(self):
+        """Write the snapshot with staged deletions removed and staged vectors appended"""
+        with self._lock:
+            staged, self._staged, self._staged_ids = self._staged, [], None
+            deleted, self._deleted_ids = self._deleted_ids, set()
+            self.refresh()
+            current_embeddings, current_scales, current_records = self.embeddings, self.scales, self.records
+
+        keep = [i for i, record in enumerate(current_records) if record["id"] not in deleted]
+        removed = len(current_records) - len(keep)
+        if not staged and not removed:
+            return
+
+        embeddings, scales = [], []
+        records = [current_records[i] for i in keep] if removed else list(current_records)
+        if current_embeddings is not None:
+            embeddings.append(current_embeddings[keep] if removed else current_embeddings)
+            scales.append(current_scales[keep] if removed else current_scales)
+        for staged_embeddings, staged_scales, staged_records in staged:
+            embeddings.append(staged_embeddings)
+            scales.append(staged_scales)
+            records.extend(staged_records)
+        added = len(records) - len(keep)
+
+        # Write the embeddings last: readers key off that file's mtime
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_records_path = f"{self.records_path}.tmp"
+        with open(tmp_records_path, 'wb') as f:
+            f.write(orjson.dumps(records))
+        os.replace(tmp_records_path, self.records_path)
+
+        for path, array in ((self.scales_path, np.concatenate(scales)), (self.embeddings_path, np.concatenate(embeddings))):
+            tmp_path = f"{path}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._loaded_mtime = None
+            self.refresh()
+        logger.info("Local index updated: %s vectors added, %s removed", added, removed)
+
+    def query(self, vector: List[float], top_k: int) -> List[Tuple[float, Dict]]:
+        """Return (score, metadata) of the top_k chunks by dot product with the query"""
+        # Take one consistent snapshot, in case another thread reloads mid-query
+        with self._lock:
+            embeddings, scales, records = self.embeddings, self.scales, self.records
+
+        # Keep the query in float32 and rescale each block of int8 rows as it is scored
+        query = np.asarray(vector, dtype=np.float32)
+        scores = np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(scores), QUERY_BLOCK_ROWS):
+            end = start + QUERY_BLOCK_ROWS
+            scores[start:end] = (embeddings[start:end].astype(np.float32) @ query) * scales[start:end]
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), records[i]["metadata"]) for i in top]
@@ -0,0 +1,53 @@
+import os
+import time
+import sqlite3
+import logging
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+class DocumentManifest:
+    """SQLite record of every document fully indexed by bootstrap
+
+    Each document is stored under its document key (content digest plus chunking
+    parameters) with its chunk count, which together determine all of its chunk ids.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "filename TEXT PRIMARY KEY, document_key TEXT NOT NULL, "
+            "chunk_count INTEGER NOT NULL, indexed_at REAL NOT NULL)"
+        )
+        return connection
+
+    def get_entries(self) -> Dict[str, Tuple[str, int]]:
+        """Return the (document key, chunk count) each document had when it was last indexed"""
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT filename, document_key, chunk_count FROM documents")
+            return {filename: (key, chunk_count) for filename, key, chunk_count in rows}
+        finally:
+            connection.close()
+
+    def record(self, entries: Dict[str, Tuple[str, int]]):
+        """Mark documents as indexed under the given (document key, chunk count)"""
+        if not entries:
+            return
+        connection = self._connect()
+        try:
+            with connection:
+                now = time.time()
+                connection.executemany(
+                    "INSERT OR REPLACE INTO documents (filename, document_key, chunk_count, indexed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(filename, key, chunk_count, now) for filename, (key, chunk_count) in entries.items()]
+                )
+            logger.info("Recorded %s indexed documents in manifest", len(entries))
+        finally:
+            connection.close()
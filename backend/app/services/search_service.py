@@ -1,95 +1,183 @@
 import os
+import httpx
 import openai
 import pinecone
 import logging
 import time
 import asyncio
+import hashlib
+import threading
 from typing import List, Dict, Any, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
-from cachetools import TTLCache
+from cachetools import LRUCache
 from config import config
+from ..utils.tokenizer import encode_for_embedding
+from ..utils.semantic_cache import SemanticCache
+from .local_index import LocalIndex
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('search_service.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class SearchService:
     _instance = None
-    _lock = asyncio.Lock()
+    # Construction is synchronous and may happen on worker threads,
+    # so a thread lock (not an asyncio one) guards the singleton
+    _lock = threading.Lock()
     
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(SearchService, cls).__new__(cls)
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(SearchService, cls).__new__(cls)
         return cls._instance
 
     def __init__(self):
-        if not hasattr(self, 'initialized'):
+        with SearchService._lock:
+            if hasattr(self, 'initialized'):
+                return
+            
             self.config = config[os.getenv('FLASK_ENV', 'default')]
             self.openai_api_key = self.config.OPENAI_API_KEY
             self.pinecone_api_key = self.config.PINECONE_API_KEY
             self.pinecone_env = self.config.PINECONE_ENV
             
-            # Initialize connection pool
-            self.initialize_connections()
-            
             # Configure limits
             self.max_concurrent_searches = self.config.MAX_CONCURRENT_SEARCHES  # e.g., 50 ,update in config
             self.search_timeout = self.config.SEARCH_TIMEOUT  # e.g., 10 seconds , update in config
             
-            # Cache configuration
-            self.cache = TTLCache(
-                maxsize=self.config.CACHE_SIZE,  # e.g., 1000
-                ttl=self.config.CACHE_TTL  # e.g., 3600 seconds
-            )
+            # Initialize connection pool
+            self.initialize_connections()
+            
+            # Cache configuration: results are purged every CACHE_TTL seconds,
+            # query embeddings are deterministic and only evicted by LRU
+            self.cache = SemanticCache(maxsize=self.config.CACHE_SIZE)  # e.g., 1000
+            self.cache_ttl = self.config.CACHE_TTL  # e.g., 3600 seconds
+            self.cache_purged_at = time.time()
+            self.embedding_cache = LRUCache(maxsize=self.config.EMBEDDING_CACHE_SIZE)
+            self.semantic_cache_threshold = self.config.SEMANTIC_CACHE_THRESHOLD
+            
+            # Optional on-disk copy of the chunk embeddings, searched locally instead of Pinecone
+            self.local_index = LocalIndex(self.config.LOCAL_INDEX_DIR) if self.config.USE_LOCAL_INDEX else None
+            # Whether the loaded snapshot holds every Pinecone vector, rechecked every CACHE_TTL seconds
+            self.local_index_complete = False
+            self.local_index_checked_version = None
+            self.local_index_checked_at = 0.0
             
             # Semaphore for limiting concurrent requests
             self.semaphore = asyncio.Semaphore(self.max_concurrent_searches)
             
             self.initialized = True
 
+    @classmethod
+    async def get_instance(cls) -> 'SearchService':
+        """Return the shared instance, building it off the event loop on first use"""
+        instance = cls._instance
+        if instance is not None and hasattr(instance, 'initialized'):
+            return instance
+        return await asyncio.to_thread(cls)
+
+    async def warmup(self):
+        """Open the OpenAI and Pinecone connections and load the tokenizer ahead of the first request"""
+        await asyncio.gather(
+            self.create_embedding("warmup", use_cache=False),
+            asyncio.to_thread(self.index.describe_index_stats)
+        )
+        logger.info("Search service warmed up")
+
+    async def aclose(self):
+        """Release the pooled OpenAI connections"""
+        await self.openai.close()
+
     def initialize_connections(self):
         """Initialize and maintain connections"""
         try:
-            openai.api_key = self.openai_api_key
+            # One pooled HTTP/2 client, so embedding calls reuse their connections
+            self.openai = openai.AsyncOpenAI(
+                api_key=self.openai_api_key,
+                http_client=httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=self.config.OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=self.config.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                    )
+                )
+            )
             pinecone.init(
                 api_key=self.pinecone_api_key,
                 environment=self.pinecone_env
             )
-            self.index = pinecone.Index(self.config.PINECONE_INDEX)
+            # Size the client pool so concurrent searches don't queue on connections
+            self.index = pinecone.Index(
+                self.config.PINECONE_INDEX,
+                pool_threads=self.max_concurrent_searches
+            )
             logger.info("Connections initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize connections: {str(e)}")
+            logger.error("Failed to initialize connections: %s", e)
             raise
 
     #@retry(stop=stop_after_attempt(2), wait=wait_exponential(multiplier=1, min=2, max=4))
-    async def create_embedding(self, query: str) -> Optional[List[float]]:
-        """Create embedding with retry logic"""
+    async def create_embedding(self, query: str, use_cache: bool = True) -> Optional[List[float]]:
+        """Create embedding with retry logic, memoized on the normalized query"""
+        query_key = self.normalize_query_key(query)
+        if use_cache:
+            embedding = self.embedding_cache.get(query_key)
+            if embedding is not None:
+                return embedding
+
         try:
-            response = await openai.embeddings.create(
-                model="text-embedding-ada-002",
-                input=query
+            response = await self.openai.embeddings.create(
+                model=self.config.EMBEDDING_MODEL,
+                input=encode_for_embedding(query, self.config.EMBEDDING_MODEL, self.config.EMBEDDING_MAX_TOKENS)
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
+            self.embedding_cache[query_key] = embedding
+            return embedding
         except Exception as e:
-            logger.error(f"Embedding creation failed: {str(e)}")
+            logger.error("Embedding creation failed: %s", e)
             raise
 
+    @staticmethod
+    def normalize_query_key(query: str) -> str:
+        """Hash a case- and whitespace-normalized query into a cache key"""
+        return hashlib.blake2b(query.strip().lower().encode(), digest_size=16).hexdigest()
+
+    def purge_expired_cache(self):
+        """Drop all cached search results once they are older than the cache TTL"""
+        now = time.time()
+        if now - self.cache_purged_at >= self.cache_ttl:
+            self.cache.clear()
+            self.cache_purged_at = now
+
+    def find_similar_cached(self, embedding: List[float], top_k: Optional[int]) -> Optional[Dict]:
+        """Return cached results of a query whose embedding is within the similarity threshold"""
+        return self.cache.find_similar(embedding, f":{top_k}", self.semantic_cache_threshold)
+
+    async def use_local_index(self) -> bool:
+        """Whether the local snapshot is loaded and holds as many vectors as Pinecone"""
+        if self.local_index is None or not await asyncio.to_thread(self.local_index.refresh):
+            return False
+
+        now = time.time()
+        if self.local_index.version != self.local_index_checked_version or \
+                now - self.local_index_checked_at >= self.cache_ttl:
+            # A partial snapshot would silently answer from a subset of the corpus
+            stats = await asyncio.to_thread(self.index.describe_index_stats)
+            self.local_index_complete = len(self.local_index) == stats.total_vector_count
+            self.local_index_checked_version = self.local_index.version
+            self.local_index_checked_at = now
+            if not self.local_index_complete:
+                logger.warning("Local index has %s vectors but Pinecone has %s, searching Pinecone",
+                               len(self.local_index), stats.total_vector_count)
+        return self.local_index_complete
+
     async def search_with_timeout(self, query: str, top_k: int = None) -> Dict:
         """Execute search with timeout"""
         async with self.semaphore:  # Limit concurrent searches
             try:
-                return await asyncio.wait_for(
-                    self._execute_search(query, top_k),
-                    timeout=self.search_timeout
-                )
+                # asyncio.timeout runs the search in the current task rather than wrapping it in a new one
+                async with asyncio.timeout(self.search_timeout):
+                    return await self._execute_search(query, top_k)
             except asyncio.TimeoutError:
-                logger.error(f"Search timeout for query: {query}")
+                logger.error("Search timeout for query: %s", query)
                 raise TimeoutError("Search request timed out")
 
     async def _execute_search(self, query: str, top_k: int = None) -> Dict:
@@ -97,34 +185,51 @@ class SearchService:
         start_time = time.time()
         
         # Check cache
-        cache_key = f"{query}:{top_k}"
+        self.purge_expired_cache()
+        query_key = self.normalize_query_key(query)
+        cache_key = f"{query_key}:{top_k}"
         if cache_key in self.cache:
-            logger.info(f"Cache hit for query: {query}")
+            logger.info("Cache hit for query: %s", query)
             return self.cache[cache_key]
 
         try:
-            # Create embedding
+            # Create embedding, skipping OpenAI for queries seen before
             embedding = await self.create_embedding(query)
             
-            # Search in Pinecone
-            search_results = self.index.query(
-                vector=embedding,
-                top_k=top_k or self.config.DEFAULT_TOP_K,
-                include_metadata=True
-            )
+            # Reuse results of a differently worded but near-identical query
+            similar_response = self.find_similar_cached(embedding, top_k)
+            if similar_response is not None:
+                logger.info("Semantic cache hit for query: %s", query)
+                self.cache.put(cache_key, embedding, similar_response)
+                return similar_response
+            
+            # Search the local snapshot when available, else Pinecone
+            # (both are blocking, so keep them off the event loop)
+            if await self.use_local_index():
+                matches = await asyncio.to_thread(
+                    self.local_index.query, embedding, top_k or self.config.MAX_SEARCH_RESULTS
+                )
+            else:
+                search_results = await asyncio.to_thread(
+                    self.index.query,
+                    vector=embedding,
+                    top_k=top_k or self.config.MAX_SEARCH_RESULTS,
+                    include_metadata=True
+                )
+                matches = [(match.score, match.metadata) for match in search_results.matches]
 
             # Format results
             formatted_results = []
-            for match in search_results.matches:
+            for score, metadata in matches:
                 formatted_results.append({
-                    "content": match.metadata.get("content", ""),
+                    "content": metadata.get("content", ""),
                     "metadata": {
-                        "case": match.metadata.get("case", ""),
-                        "year": match.metadata.get("year", ""),
-                        "court": match.metadata.get("court", ""),
-                        "citation": match.metadata.get("citation", "")
+                        "case": metadata.get("case", ""),
+                        "year": metadata.get("year", ""),
+                        "court": metadata.get("court", ""),
+                        "citation": metadata.get("citation", "")
                     },
-                    "similarity_score": match.score
+                    "similarity_score": score
                 })
 
             response = {
@@ -133,24 +238,24 @@ class SearchService:
                 "processing_time": f"{time.time() - start_time:.2f}s"
             }
 
-            # Cache results
-            self.cache[cache_key] = response
+            # Cache results alongside the query embedding for semantic lookups
+            self.cache.put(cache_key, embedding, response)
             return response
 
         except Exception as e:
-            logger.error(f"Search failed: {str(e)}")
+            logger.error("Search failed: %s", e)
             raise
 
     async def health_check(self) -> Dict:
         """Check service health"""
         try:
             # Test embedding creation
-            test_embedding = await self.create_embedding("test")
+            test_embedding = await self.create_embedding("test", use_cache=False)
             if not test_embedding:
                 return {"status": "unhealthy", "error": "Embedding creation failed"}
 
             # Test Pinecone connection
-            self.index.describe_index_stats()
+            await asyncio.to_thread(self.index.describe_index_stats)
 
             return {
                 "status": "healthy",
@@ -158,5 +263,5 @@ class SearchService:
                 "active_connections": self.semaphore._value
             }
         except Exception as e:
-            logger.error(f"Health check failed: {str(e)}")
+            logger.error("Health check failed: %s", e)
             return {"status": "unhealthy", "error": str(e)}
\ No newline at end of file
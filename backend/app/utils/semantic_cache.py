@@ -0,0 +1,62 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+from cachetools import Cache, LRUCache
+
+class SemanticCache(LRUCache):
+    """LRU cache of search responses that keeps each entry's query embedding in one matrix
+
+    Similarity lookups score every entry with a single matrix-vector product, and read
+    matches without touching recency so a scan never reorders the LRU.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        # Allocated on the first put, once the embedding dimension is known
+        self._embeddings: Optional[np.ndarray] = None
+        self._valid = np.zeros(maxsize, dtype=bool)
+        self._row_keys: List[Optional[str]] = [None] * maxsize
+        self._rows: Dict[str, int] = {}
+        self._free_rows = list(range(maxsize - 1, -1, -1))
+
+    def put(self, key: str, embedding: List[float], response: Any):
+        """Cache a response along with the embedding of the query that produced it"""
+        # Inserting first lets a full cache evict, which frees a row for this entry
+        self[key] = response
+        row = self._rows.get(key)
+        if row is None:
+            row = self._free_rows.pop()
+            self._rows[key] = row
+            self._row_keys[row] = key
+        if self._embeddings is None:
+            self._embeddings = np.zeros((len(self._valid), len(embedding)), dtype=np.float32)
+        self._embeddings[row] = embedding
+        self._valid[row] = True
+
+    def find_similar(self, embedding: List[float], key_suffix: str, threshold: float) -> Optional[Any]:
+        """Return the most similar cached response whose key ends with key_suffix, if above threshold"""
+        if self._embeddings is None or not self._rows:
+            return None
+
+        # Embeddings are unit length, so the dot product is their cosine similarity
+        scores = self._embeddings @ np.asarray(embedding, dtype=np.float32)
+        candidates = np.flatnonzero(self._valid & (scores >= threshold))
+        for row in candidates[np.argsort(-scores[candidates])]:
+            key = self._row_keys[row]
+            if key.endswith(key_suffix):
+                return Cache.__getitem__(self, key)
+        return None
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._valid[row] = False
+            self._row_keys[row] = None
+            self._free_rows.append(row)
+
+    def clear(self):
+        super().clear()
+        self._valid[:] = False
+        self._row_keys = [None] * len(self._valid)
+        self._rows.clear()
+        self._free_rows = list(range(len(self._valid) - 1, -1, -1))
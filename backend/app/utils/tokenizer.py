@@ -0,0 +1,18 @@
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import tiktoken
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Load (once) the tokenizer used by an OpenAI model"""
+    return tiktoken.encoding_for_model(model)
+
+def encode_for_embedding(text: str, model: str, max_tokens: int) -> List[int]:
+    """Tokenize text and truncate it to the embedding model's input limit"""
+    return get_encoding(model).encode_ordinary(text)[:max_tokens]
+
+def deduplicate(texts: List[str]) -> Tuple[List[str], List[int]]:
+    """Return the unique texts and, for every input text, the index of its unique copy"""
+    unique: Dict[str, int] = {}
+    inverse = [unique.setdefault(text, len(unique)) for text in texts]
+    return list(unique), inverse
@@ -13,16 +13,28 @@ class Config:
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
     PDF_DIR = os.path.join(BASE_DIR,'app', 'docs', 'pdfs')
     METADATA_PATH = os.path.join(BASE_DIR,'app', 'docs', 'metadata.json')
+    PDF_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'pdf_text')  # Extracted text, keyed by PDF hash
+    MANIFEST_PATH = os.path.join(BASE_DIR, 'cache', 'manifest.sqlite')  # Documents already indexed, by content hash
+
+    # Logging
+    LOG_FILE = os.environ.get('LOG_FILE') or 'app.log'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
 
     # API Keys
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     PINECONE_API_KEY = os.environ.get('PINECONE_API_KEY')
     PINECONE_ENV = os.environ.get('PINECONE_ENV')
     PINECONE_INDEX = os.environ.get('PINECONE_INDEX')
+    PINECONE_POOL_THREADS = 30  # Threads used for async_req upserts/queries
+
+    # OpenAI HTTP client pool
+    OPENAI_MAX_CONNECTIONS = 100
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = 100  # Keep every pooled connection warm between bursts
 
     # Chunking Configuration
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200  # Optional: If we want overlapping chunks
+    METADATA_CONTENT_LIMIT = 2000  # Max chars of chunk text stored in Pinecone metadata
 
     # Search Configuration
     MAX_SEARCH_RESULTS = 5
@@ -31,10 +43,23 @@ class Config:
     SEARCH_TIMEOUT = 5
     CACHE_SIZE = 3
     CACHE_TTL = 60
+    EMBEDDING_CACHE_SIZE = 100
+    SEMANTIC_CACHE_THRESHOLD = 0.98  # Cosine similarity for reusing another query's results
+
+    # Local copy of chunk embeddings written by bootstrap and memory-mapped by search
+    USE_LOCAL_INDEX = os.environ.get('USE_LOCAL_INDEX', '').lower() == 'true'
+    LOCAL_INDEX_DIR = os.path.join(BASE_DIR, 'cache', 'local_index')
     
-    MAX_WORKERS = 3
+    # Each server process builds its own extraction pool, so split the cores between them;
+    # set SERVER_WORKERS to the server's worker count (e.g. hypercorn -w) or MAX_WORKERS directly
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 1)
+    MAX_WORKERS = int(os.environ.get('MAX_WORKERS') or max(1, (os.cpu_count() or 1) // SERVER_WORKERS))  # PDF extraction processes
+    MAX_DOCUMENTS_IN_FLIGHT = MAX_WORKERS * 2  # Extracted documents held in memory at once
     BATCH_SIZE = 3
-    EMBEDDING_BATCH_SIZE = 3
+    EMBEDDING_MODEL = 'text-embedding-ada-002'
+    EMBEDDING_MAX_TOKENS = 8191  # Input limit of the embedding model
+    EMBEDDING_BATCH_SIZE = 100  # Chunks per embedding request and vectors per upsert
+    EMBEDDING_CONCURRENCY = MAX_CONCURRENT_SEARCHES  # Concurrent OpenAI embedding requests
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -1,170 +1,208 @@
 import asyncio
 import logging
 import os
+import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
+# Prefer libuv's event loop where available (uvloop does not support Windows)
 try:
-    from app.services.document_service import DocumentService
-    from app.services.bootstrap_service import BootstrapService
-    from app.services.search_service import SearchService
-    print("Services imported successfully")
-except Exception as e:
-    print(f"Critical error during imports: {e}")
-    print(traceback.format_exc())
-    exit(1)
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
 
-# Setup logging
+from pythonjsonlogger import jsonlogger
+
+# Setup logging: one JSON object per line on stdout, with step details passed via `extra`
+handler = logging.StreamHandler(sys.stdout)
+handler.setFormatter(jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
 logging.basicConfig(
-    level=logging.DEBUG,  # DEBUG level for maximum verbosity
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    level=os.getenv("LOG_LEVEL", "INFO"),  # LOG_LEVEL=DEBUG for maximum verbosity
+    handlers=[handler]
 )
 logger = logging.getLogger(__name__)
 
-async def test_document_service():
-    logger.info("Entered test_document_service function")
+try:
+    from app.services.document_service import DocumentService, is_pdf
+    from app.services.bootstrap_service import BootstrapService
+    from app.services.search_service import SearchService
+    logger.debug("Services imported successfully")
+except Exception:
+    logger.critical("Critical error during imports", exc_info=True)
+    exit(1)
+
+def list_pdfs(pdf_dir):
+    with os.scandir(pdf_dir) as entries:
+        return [e.name for e in entries if e.is_file() and is_pdf(e.name)]
+
+async def build_service(name, factory):
     try:
-        logger.debug("Initializing DocumentService")
-        doc_service = DocumentService()
-        logger.debug("DocumentService initialized successfully")
-        print(f"DocumentService initialized: {doc_service}")
-    except Exception as e:
-        logger.error(f"Error initializing DocumentService: {e}")
-        print(traceback.format_exc())
+        logger.debug("Initializing %s", name)
+        service = await factory()
+        logger.info("Service initialized", extra={"service": name})
+        return service
+    except Exception:
+        logger.exception("Error initializing %s", name)
+        return None
+
+@asynccontextmanager
+async def service_context():
+    """Build each service once and share it across all test suites"""
+    # Construct the services concurrently so startup costs max() rather than sum() of their init times
+    bootstrap_service, search_service = await asyncio.gather(
+        build_service("BootstrapService", lambda: asyncio.to_thread(BootstrapService)),
+        build_service("SearchService", SearchService.get_instance)
+    )
+    # BootstrapService already owns a DocumentService, so reuse it rather than building a second one
+    doc_service = bootstrap_service.doc_service if bootstrap_service else await build_service(
+        "DocumentService", lambda: asyncio.to_thread(DocumentService)
+    )
+    try:
+        yield doc_service, bootstrap_service, search_service
+    finally:
+        # Close the pooled clients once per session, not per call
+        if bootstrap_service:
+            await bootstrap_service.aclose()
+        elif doc_service:
+            doc_service.close()
+        if search_service:
+            await search_service.aclose()
+
+async def test_document_service(doc_service):
+    logger.info("Entered test_document_service function")
+    if doc_service is None:
         return
 
     # Test loading metadata
     try:
         logger.debug("Attempting to load metadata")
-        metadata = doc_service.load_metadata()
-        logger.info(f"Loaded metadata: {len(metadata)} entries")
-        print(f"Metadata loaded: {metadata}")
-    except Exception as e:
-        logger.error(f"Error loading metadata: {e}")
-        print(traceback.format_exc())
+        metadata = await asyncio.to_thread(doc_service.load_metadata)
+        logger.info("Loaded metadata", extra={"entries": len(metadata)})
+        logger.debug("Metadata contents", extra={"metadata": metadata})
+    except Exception:
+        logger.exception("Error loading metadata")
 
     # Test processing single document
     try:
-        logger.debug(f"Looking for PDFs in directory: {doc_service.pdf_dir}")
-        if not os.path.exists(doc_service.pdf_dir):
-            logger.error(f"PDF directory does not exist: {doc_service.pdf_dir}")
-            print(f"PDF directory does not exist: {doc_service.pdf_dir}")
+        logger.debug("Looking for PDFs in directory: %s", doc_service.pdf_dir)
+        if not await asyncio.to_thread(os.path.exists, doc_service.pdf_dir):
+            logger.error("PDF directory does not exist", extra={"pdf_dir": doc_service.pdf_dir})
             return
 
-        pdfs = [f for f in os.listdir(doc_service.pdf_dir) if f.endswith('.pdf')]
-        logger.debug(f"Found PDFs: {pdfs}")
-        print(f"PDFs found: {pdfs}")
+        pdfs = await asyncio.to_thread(list_pdfs, doc_service.pdf_dir)
+        logger.info("Found PDFs", extra={"pdf_count": len(pdfs), "pdfs": pdfs})
 
         if pdfs:
-            logger.debug(f"Processing first document: {pdfs[0]}")
-            document = doc_service.process_single_document(pdfs[0], metadata)
-            logger.info(f"Processed document: {document['metadata']['filename']}")
-            print(f"Processed document: {document}")
+            logger.debug("Processing first document: %s", pdfs[0])
+            document = await asyncio.to_thread(doc_service.process_single_document, pdfs[0])
+            # `filename` is a reserved LogRecord attribute, so it cannot be passed as an extra key
+            logger.info("Processed document", extra={
+                "document": document['metadata']['filename'],
+                "content_length": len(document['content'])
+            })
+            logger.debug("Processed document contents", extra={"processed": document})
         else:
-            logger.warning("No PDFs found in the directory")
-            print("No PDFs found in the directory")
-    except Exception as e:
-        logger.error(f"Error processing single document: {e}")
-        print(traceback.format_exc())
+            logger.warning("No PDFs found in the directory", extra={"pdf_dir": doc_service.pdf_dir})
+    except Exception:
+        logger.exception("Error processing single document")
 
-async def test_bootstrap_service():
-    logger.info("Entered test_bootstrap_service function")
+    # Test processing all documents into chunks
     try:
-        logger.debug("Initializing BootstrapService")
-        bootstrap_service = BootstrapService()
-        logger.debug("BootstrapService initialized successfully")
-        print(f"BootstrapService initialized: {bootstrap_service}")
-    except Exception as e:
-        logger.error(f"Error initializing BootstrapService: {e}")
-        print(traceback.format_exc())
+        logger.debug("Processing all documents into chunks")
+        chunk_counts = {}
+        async for chunk in doc_service.iter_chunks():
+            filename = chunk['metadata']['filename']
+            chunk_counts[filename] = chunk_counts.get(filename, 0) + 1
+        logger.info("Created chunks", extra={
+            "total_chunks": sum(chunk_counts.values()),
+            "documents": len(chunk_counts),
+            "chunks_per_document": chunk_counts
+        })
+    except Exception:
+        logger.exception("Error processing all documents")
+
+async def test_bootstrap_service(bootstrap_service):
+    logger.info("Entered test_bootstrap_service function")
+    if bootstrap_service is None:
         return
 
     # Test bootstrap process
     try:
         logger.debug("Starting bootstrap process")
         results = await bootstrap_service.bootstrap()
-        logger.info(f"Bootstrap completed. Stats: {results['stats']}")
-        print(f"Bootstrap results: {results}")
-    except Exception as e:
-        logger.error(f"Error in bootstrap process: {e}")
-        print(traceback.format_exc())
-
-async def test_search_service():
+        logger.info("Bootstrap completed", extra={
+            "bootstrap_status": results['status'],
+            "stats": results['stats'],
+            "execution_time": results['execution_time']
+        })
+    except Exception:
+        logger.exception("Error in bootstrap process")
+
+async def test_search_service(search_service):
     logger.info("Entered test_search_service function")
-    try:
-        logger.debug("Initializing SearchService")
-        search_service = SearchService()
-        logger.debug("SearchService initialized successfully")
-        print(f"SearchService initialized: {search_service}")
-    except Exception as e:
-        logger.error(f"Error initializing SearchService: {e}")
-        print(traceback.format_exc())
+    if search_service is None:
         return
 
     # Test creating embeddings
     try:
         query = "Example legal query"
-        logger.debug(f"Creating embedding for query: {query}")
+        logger.debug("Creating embedding for query: %s", query)
         embedding = await search_service.create_embedding(query)
         if embedding:
-            logger.info(f"Successfully created embedding for query: {query}")
-            print(f"Embedding created: {embedding}")
+            logger.info("Created embedding", extra={"query": query, "dimensions": len(embedding)})
         else:
-            logger.warning("Embedding creation returned None")
-            print("Embedding creation returned None")
-    except Exception as e:
-        logger.error(f"Error creating embedding: {e}")
-        print(traceback.format_exc())
+            logger.warning("Embedding creation returned None", extra={"query": query})
+    except Exception:
+        logger.exception("Error creating embedding")
 
     # Test search functionality
     try:
         query = "Example legal query"
-        logger.debug(f"Searching with query: {query}")
+        logger.debug("Searching with query: %s", query)
         search_results = await search_service.search_with_timeout(query, top_k=5)
-        logger.info(f"Search results: {search_results['results']}")
-        print(f"Search results: {search_results}")
-    except Exception as e:
-        logger.error(f"Error in search functionality: {e}")
-        print(traceback.format_exc())
+        logger.info("Search completed", extra={"query": query, "total_results": search_results['total_results']})
+        logger.debug("Search results", extra={"search_results": search_results})
+    except Exception:
+        logger.exception("Error in search functionality")
 
     # Test health check
     try:
         logger.debug("Performing health check")
         health_status = await search_service.health_check()
-        logger.info(f"SearchService health status: {health_status}")
-        print(f"Health check status: {health_status}")
-    except Exception as e:
-        logger.error(f"Error in health check: {e}")
-        print(traceback.format_exc())
+        logger.info("Health check completed", extra={"health": health_status})
+    except Exception:
+        logger.exception("Error in health check")
 
 async def run_tests():
+    # Bound the threads used by asyncio.to_thread across the concurrent suites
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+    )
     logger.info("Starting all tests...")
-    print("Starting all tests...")
-    try:
-        await test_document_service()
-    except Exception as e:
-        logger.error(f"Error during DocumentService tests: {e}")
-        print(traceback.format_exc())
-
-    try:
-        await test_bootstrap_service()
-    except Exception as e:
-        logger.error(f"Error during BootstrapService tests: {e}")
-        print(traceback.format_exc())
-
-    try:
-        await test_search_service()
-    except Exception as e:
-        logger.error(f"Error during SearchService tests: {e}")
-        print(traceback.format_exc())
+    async with service_context() as (doc_service, bootstrap_service, search_service):
+        # The services are independent and I/O-bound, so let their waits overlap
+        suites = {
+            "DocumentService": test_document_service(doc_service),
+            "BootstrapService": test_bootstrap_service(bootstrap_service),
+            "SearchService": test_search_service(search_service),
+        }
+        results = await asyncio.gather(*suites.values(), return_exceptions=True)
+
+    for name, result in zip(suites, results):
+        if isinstance(result, Exception):
+            # Format each failed suite's traceback exactly once
+            logger.error("Error during tests", extra={
+                "suite": name,
+                "traceback": "".join(traceback.format_exception(type(result), result, result.__traceback__))
+            })
 
 if __name__ == "__main__":
-    print("Starting script...")
     logger.info("Starting local tests...")
     try:
         logger.debug("About to run asyncio loop")
         asyncio.run(run_tests())
         logger.info("Completed running tests")
-        print("Completed running tests")
-    except Exception as e:
-        logger.critical(f"Critical error in main execution: {e}")
-        print(traceback.format_exc())
+    except Exception:
+        logger.critical("Critical error in main execution", exc_info=True)
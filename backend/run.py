@@ -1,8 +1,25 @@
-from flask import Flask
-from flask_cors import CORS
+import os
+import asyncio
 from app import create_app
+from config import config
 
+# ASGI app; in production serve with e.g. `SERVER_WORKERS=4 hypercorn run:app -w 4 -k uvloop`
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
+    if config[os.getenv('FLASK_ENV', 'default')].DEBUG:
+        # Development server with debugger and reloader
+        app.run(debug=True)
+    else:
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config as HypercornConfig
+
+        hypercorn_config = HypercornConfig()
+        hypercorn_config.bind = [os.getenv('BIND', '0.0.0.0:5000')]
+        asyncio.run(serve(app, hypercorn_config))
\ No newline at end of file